@@ -20,7 +20,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import itertools
 import multiprocessing
 import os
 import sys
@@ -54,6 +53,44 @@ def compatible_eval_result(results: Dict) -> Dict:
 
 
 # unbiased estimator from https://github.com/openai/human-eval
+def estimate_pass_at_ks(
+    num_samples: Union[int, List[int], np.ndarray],
+    num_correct: Union[List[int], np.ndarray],
+    ks: List[int],
+) -> Dict[int, np.ndarray]:
+    """
+    Estimates pass@k of each problem for several k in one pass and returns
+    a dict of k to array.
+
+    Calculates 1 - comb(n - c, k) / comb(n, k) for all problems at once via
+    a single log-factorial table shared across every requested k.
+    """
+    c = np.asarray(num_correct, dtype=np.int64)
+    if isinstance(num_samples, int):
+        n = np.full(len(c), num_samples, dtype=np.int64)
+    else:
+        assert len(num_samples) == len(num_correct)
+        n = np.asarray(num_samples, dtype=np.int64)
+    if c.size == 0:
+        return {k: np.ones(0, dtype=np.float64) for k in ks}
+
+    log_fact = np.zeros(int(n.max()) + 1)
+    log_fact[1:] = np.cumsum(np.log(np.arange(1, int(n.max()) + 1)))
+
+    estimates = {}
+    for k in ks:
+        out = np.ones(len(c), dtype=np.float64)
+        mask = n - c >= k
+        nm, cm = n[mask], c[mask]
+        # log of comb(n - c, k) / comb(n, k)
+        log_ratio = (
+            log_fact[nm - cm] + log_fact[nm - k] - log_fact[nm - cm - k] - log_fact[nm]
+        )
+        out[mask] = 1.0 - np.exp(log_ratio)
+        estimates[k] = out
+    return estimates
+
+
 def estimate_pass_at_k(
     num_samples: Union[int, List[int], np.ndarray],
     num_correct: Union[List[int], np.ndarray],
@@ -62,24 +99,25 @@ def estimate_pass_at_k(
     """
     Estimates pass@k of each problem and returns them in an array.
     """
+    return estimate_pass_at_ks(num_samples, num_correct, [k])[k]
 
-    def estimator(n: int, c: int, k: int) -> float:
-        """
-        Calculates 1 - comb(n - c, k) / comb(n, k).
-        """
-        if n - c < k:
-            return 1.0
-        return 1.0 - np.prod(1.0 - k / np.arange(n - c + 1, n + 1))
 
-    if isinstance(num_samples, int):
-        num_samples_it = itertools.repeat(num_samples, len(num_correct))
-    else:
-        assert len(num_samples) == len(num_correct)
-        num_samples_it = iter(num_samples)
+# Compiled test harnesses keyed by their source. Workers inherit warm
+# entries through fork and otherwise fill the cache lazily, so each harness
+# is compiled at most once per process tree instead of once per sample.
+_compiled_tests = {}
+
+
+def seed_compiled_tests(compiled: Dict[str, Any]) -> None:
+    _compiled_tests.update(compiled)
 
-    return np.array(
-        [estimator(int(n), int(c), k) for n, c in zip(num_samples_it, num_correct)]
-    )
+
+def compile_test(test_code: str):
+    compiled = _compiled_tests.get(test_code)
+    if compiled is None:
+        compiled = compile(test_code, "__test__.py", "exec")
+        _compiled_tests[test_code] = compiled
+    return compiled
 
 
 PASS = "pass"
@@ -141,10 +179,11 @@ def unsafe_execute(
         })
 
         try:
-            full_code = code + "\n" + test_code
-
             with swallow_io():
-                exec(compile(full_code, f"{module_name}.py", 'exec'), new_module.__dict__)
+                exec(compile(code, f"{module_name}.py", 'exec'), new_module.__dict__)
+                # The test harness is shared by every sample of the task, so
+                # reuse its compiled form instead of recompiling per check.
+                exec(compile_test(test_code), new_module.__dict__)
                 sys.modules[module_name] = new_module
                 TestCases = getattr(new_module, 'TestCases')
                 loader = unittest.TestLoader()
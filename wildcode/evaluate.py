@@ -1,17 +1,28 @@
 import argparse
+import atexit
+import gc
 import json
+import marshal
 import multiprocessing
 import os
-import pickle
+import queue
 import threading
 import time
-from collections import Counter, defaultdict
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from typing import Any, Dict, List, Tuple
 from warnings import warn
 
+import ijson
 import numpy as np
+import orjson
 from termcolor import cprint
 from tqdm import tqdm
 
@@ -23,8 +34,8 @@ from wildcode.data import (
 from wildcode.data.utils import CACHE_DIR
 from wildcode.eval import (
     PASS,
-    compatible_eval_result,
-    estimate_pass_at_k,
+    estimate_pass_at_ks,
+    seed_compiled_tests,
     untrusted_check,
 )
 from wildcode.gen.util import trusted_exec
@@ -33,60 +44,310 @@ from wildcode.gen.util import trusted_exec
 # 2nd item (optional): the detailed pass/fail boolean for each input
 Result = Tuple[str, List[bool]]
 
+# Problems and groundtruth timings live in module globals so that submits
+# only need to carry the task_id instead of pickling them per batch. With
+# the `fork` start method the workers inherit both read-only via
+# copy-on-write; elsewhere `_init_worker` reloads the dataset from its
+# cache and receives the timings once through the initializer arguments.
+_WORKER_PROBLEMS = None
+_WORKER_EXPECTED_TIME = None
+
+# The pool is created lazily and reused across `evaluate()` invocations to
+# avoid paying the spawn + initializer cost on repeat runs.
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _init_worker(expected_time=None):
+    global _WORKER_PROBLEMS, _WORKER_EXPECTED_TIME
+    if _WORKER_PROBLEMS is None:
+        _WORKER_PROBLEMS = get_wildcodebench()
+    if _WORKER_EXPECTED_TIME is None:
+        _WORKER_EXPECTED_TIME = expected_time
+    if hasattr(os, "sched_setaffinity"):
+        # Pin each worker (and the checker processes it forks) to one core
+        # so tests do not migrate between CPUs mid-run.
+        identity = multiprocessing.current_process()._identity
+        if identity:
+            try:
+                cpus = sorted(os.sched_getaffinity(0))
+                os.sched_setaffinity(0, {cpus[(identity[0] - 1) % len(cpus)]})
+            except OSError:
+                pass
+
+
+def _get_executor(n_workers, problems, expected_time):
+    global _EXECUTOR, _WORKER_PROBLEMS, _WORKER_EXPECTED_TIME
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            # Populate before the pool forks so children share the dicts
+            # without any per-task serialization.
+            _WORKER_PROBLEMS = problems
+            _WORKER_EXPECTED_TIME = expected_time
+            if "fork" in multiprocessing.get_all_start_methods():
+                mp_context = multiprocessing.get_context("fork")
+            else:
+                mp_context = None
+            _EXECUTOR = ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=mp_context,
+                initializer=_init_worker,
+                initargs=(expected_time,),
+            )
+        return _EXECUTOR
+
+
+def _discard_executor():
+    """Drop the cached pool, e.g. after a worker died and broke it."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+            _EXECUTOR = None
+
+
+# Make sure the cached pool's workers are reaped on interpreter exit.
+atexit.register(_discard_executor)
+
+
+def _seed_compiled_tests(problems, hashcode):
+    """Warm the compiled-test cache, persisting it next to the timing cache.
+
+    This runs in the parent before any check is submitted, so forked workers
+    inherit the compiled harnesses via copy-on-write. marshal is tied to the
+    interpreter's bytecode format, so an unreadable file is just recompiled.
+    """
+    cache_file = os.path.join(CACHE_DIR, f"{hashcode}.tests.marshal")
+    compiled = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                compiled = marshal.load(f)
+        except (EOFError, ValueError, TypeError):
+            compiled = None
+    if compiled is None:
+        compiled = {
+            task_id: compile(problem["test"], "__test__.py", "exec")
+            for task_id, problem in problems.items()
+        }
+        with open(cache_file, "wb") as f:
+            marshal.dump(compiled, f)
+    seed_compiled_tests(
+        {
+            problems[task_id]["test"]: code
+            for task_id, code in compiled.items()
+            if task_id in problems
+        }
+    )
+
+
+def _trusted_exec_chunk(chunk):
+    return [trusted_exec(code, test, task_id) for code, test, task_id in chunk]
+
 
-def get_groundtruth(problems, hashcode, check_gt_only):
-    cache_file = os.path.join(CACHE_DIR, f"{hashcode}.pkl")
+def get_groundtruth(
+    problems, hashcode, check_gt_only, n_workers, abort=None, disable_pbar=False
+):
+    cache_file = os.path.join(CACHE_DIR, f"{hashcode}.npz")
     if os.path.exists(cache_file):
         if check_gt_only:
             os.remove(cache_file)
         else:
             print(f"Load from ground-truth from {cache_file}")
-            with open(cache_file, "rb") as f:
-                return pickle.load(f)
+            _seed_compiled_tests(problems, hashcode)
+            cached = np.load(cache_file)
+            return dict(zip(cached["task_ids"].tolist(), cached["times"].tolist()))
 
     os.makedirs(CACHE_DIR, exist_ok=True)
     print("\nAsserting the groundtruth...")
     tbegin = time.time()
+    task_ids = list(problems.keys())
+    codes = [
+        problem["prompt"] + "\n" + problem["clean_canonical_solution"]
+        for problem in problems.values()
+    ]
+    tests = [problem["test"] for problem in problems.values()]
+    # Chunks are submitted as individual futures (rather than
+    # map(chunksize=...)) so an abort is noticed between completions
+    # instead of blocking on the next chunk's result.
+    jobs = list(zip(codes, tests, task_ids))
+    chunks = [jobs[i : i + 4] for i in range(0, len(jobs), 4)]
     expected_time = {}
-    for task_id, problem in tqdm(problems.items()):
-        expected_time[task_id] = trusted_exec(
-            problem["prompt"] + "\n" + problem["clean_canonical_solution"],
-            problem["test"],
-            problem["task_id"],
-        )
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        future_chunks = {
+            executor.submit(_trusted_exec_chunk, chunk): chunk for chunk in chunks
+        }
+        pending = set(future_chunks)
+        with tqdm(total=len(task_ids), disable=disable_pbar) as pbar:
+            while pending:
+                done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                if abort is not None and abort.is_set():
+                    # Cancel everything still queued; only the chunks
+                    # already running on a worker drain before shutdown.
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise RuntimeError("Groundtruth assertion aborted")
+                for future in done:
+                    for (_, _, task_id), exec_time in zip(
+                        future_chunks[future], future.result()
+                    ):
+                        expected_time[task_id] = exec_time
+                        pbar.update(1)
     print(f"Expected outputs computed in {time.time() - tbegin:.2f}s")
-    
-    with open(cache_file, "wb") as f:
-        pickle.dump(expected_time, f)
+
+    np.savez_compressed(
+        cache_file,
+        task_ids=np.array(task_ids),
+        times=np.array([expected_time[task_id] for task_id in task_ids]),
+    )
+    _seed_compiled_tests(problems, hashcode)
 
     return expected_time
 
 def check_correctness(
     dataset: str,
     completion_id: int,
-    problem: Dict[str, Any],
+    task_id: str,
     solution: str,
     identifier=None,
     min_time_limit: float = 0.1,
     gt_time_limit: float = 2.0
 ) -> Dict[str, Result]:  # {...}, "base" | "plus" -> (status, details)
+    problem = _WORKER_PROBLEMS[task_id]
     ret = {
         "completion_id": completion_id,
-        "task_id": problem["task_id"],
+        "task_id": task_id,
         "_identifier": identifier,
         "solution": solution,
     }
-    ret["base"] = untrusted_check(
-        dataset,
-        solution,
-        problem["test"],
-        problem["entry_point"],
-        min_time_limit,
-        gt_time_limit
-    )
+    # Cyclic GC pauses only slow the check down; the forked checker process
+    # inherits the disabled state and is short-lived anyway.
+    gc.disable()
+    try:
+        ret["base"] = untrusted_check(
+            dataset,
+            solution,
+            problem["test"],
+            problem["entry_point"],
+            min_time_limit,
+            gt_time_limit
+        )
+    finally:
+        gc.enable()
     return ret
 
 
+def _load_pass_counts(result_path):
+    """Stream per-task pass counts from a previous result file.
+
+    Only the status of each entry matters for pass@k, so the document is
+    parsed incrementally with ijson one task at a time instead of
+    materializing the whole dict (solutions, tracebacks and all) the way
+    json.load would.
+    """
+    totals = []
+    corrects = []
+    with open(result_path, "rb") as f:
+        for _, task_results in ijson.kvitems(f, "eval"):
+            totals.append(len(task_results))
+            corrects.append(sum(r["status"] == PASS for r in task_results))
+    return (
+        np.array(totals, dtype=np.int64),
+        np.array(corrects, dtype=np.int64),
+    )
+
+
+def _dumps(obj):
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        # orjson rejects strings containing lone surrogates, which model
+        # output can legally carry into a solution; json escapes them to
+        # ASCII \uXXXX sequences instead.
+        return json.dumps(obj).encode("utf-8")
+
+
+def _write_results(result_path, results):
+    """Serialize results task by task with orjson.
+
+    Writing each task's entry straight to the file handle avoids building the
+    full multi-hundred-megabyte JSON string in memory before the write. The
+    document goes to a temp file first and is renamed into place so a failed
+    write can never leave a truncated result file behind to poison resume.
+    """
+    tmp_path = result_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(b'{"date":' + _dumps(results["date"]) + b',"eval":{')
+            first = True
+            for task_id, task_results in results["eval"].items():
+                if not first:
+                    f.write(b",")
+                first = False
+                f.write(_dumps(task_id) + b":" + _dumps(task_results))
+            f.write(b"}}")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.rename(tmp_path, result_path)
+
+
+def _stream_samples(sample_path):
+    """Yield samples from `load_solutions` parsed on a background thread.
+
+    Decoding the JSONL on a producer thread lets the main thread keep
+    submitting work to the pool instead of idling through the parse.
+    """
+    samples = queue.Queue(maxsize=1024)
+    end = object()
+
+    def producer():
+        try:
+            for sample in load_solutions(sample_path):
+                samples.put(sample)
+            samples.put(end)
+        except BaseException as e:
+            samples.put(e)
+
+    # Daemonized so that a crash in the consumer cannot leave the process
+    # hanging on a producer blocked against the bounded queue.
+    threading.Thread(target=producer, daemon=True).start()
+    while True:
+        item = samples.get()
+        if item is end:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+# Samples for the same task are shipped in groups of this size so that one
+# future amortizes the IPC round-trip over several completions without
+# letting a single huge group straggle at the end of the run.
+_BATCH_SIZE = 16
+
+
+def _check_batch(
+    dataset: str,
+    task_id: str,
+    batch: List[Tuple[int, str, Any]],
+    min_time_limit: float,
+) -> List[Dict[str, Result]]:
+    gt_time_limit = _WORKER_EXPECTED_TIME[task_id]
+    return [
+        check_correctness(
+            dataset,
+            completion_id,
+            task_id,
+            solution,
+            identifier,
+            min_time_limit,
+            gt_time_limit,
+        )
+        for completion_id, solution, identifier in batch
+    ]
+
+
 def evaluate(flags):
     if flags.parallel is None:
         n_workers = max(1, multiprocessing.cpu_count() // 2)
@@ -109,41 +370,119 @@ def evaluate(flags):
         else:
             result_path = flags.samples.replace(".jsonl", "_eval_results.json")
 
-    if os.path.isfile(result_path):
-        print(f"Load from previous results from {result_path}")
-        with open(result_path, "r") as f:
-            results = json.load(f)
+    # Sidecar with per-task sample/pass counts; resuming for pass@k only
+    # needs these, not the full result document.
+    counts_path = result_path + ".counts.npz"
 
-        results = compatible_eval_result(results)
+    results = None
+    total = None
+    base_correct = None
+    if os.path.isfile(result_path):
+        # Only trust a sidecar at least as fresh as the result file; a
+        # restored backup or results dropped in from another run must not
+        # resurface the old counts.
+        if os.path.isfile(counts_path) and os.path.getmtime(
+            counts_path
+        ) >= os.path.getmtime(result_path):
+            print(f"Load cached pass counts from {counts_path}")
+            counts = np.load(counts_path)
+            total = counts["total"]
+            base_correct = counts["base_correct"]
+        else:
+            print(f"Load from previous results from {result_path}")
+            total, base_correct = _load_pass_counts(result_path)
+            # Refresh the sidecar so later resumes skip the re-parse.
+            np.savez_compressed(counts_path, total=total, base_correct=base_correct)
     else:
         if flags.dataset == "wildcodebench":
             problems = get_wildcodebench()
-            dataset_hash = get_wildcodebench_hash()       
-            expected_time = get_groundtruth(problems, dataset_hash, flags.check_gt_only)
-        
+            dataset_hash = get_wildcodebench_hash()
+            # Run the groundtruth timing on a daemon thread so its
+            # cold-cache cost overlaps with reading the samples below. Its
+            # progress bar is disabled when overlapped so it does not fight
+            # the "Reading samples" bar for the terminal line, and the
+            # abort event lets the error path cancel leftover work instead
+            # of blocking shutdown on the full pass.
+            gt_future = Future()
+            gt_abort = threading.Event()
+
+            def run_groundtruth():
+                try:
+                    gt_future.set_result(
+                        get_groundtruth(
+                            problems,
+                            dataset_hash,
+                            flags.check_gt_only,
+                            n_workers,
+                            abort=gt_abort,
+                            disable_pbar=not flags.check_gt_only,
+                        )
+                    )
+                except BaseException as e:
+                    gt_future.set_exception(e)
+
+            threading.Thread(target=run_groundtruth, daemon=True).start()
+
         if flags.check_gt_only:
+            gt_future.result()
             return
-        
+
+        expected_time = None
+
         results = {
             "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
             "eval": {},
         }
 
-        with ProcessPoolExecutor(max_workers=n_workers) as executor:
-            futures = []
-            completion_id = Counter()
-            n_samples = 0
-            eval_results = defaultdict(list)  # task_id ->
-            remainings = set()
-
-            print("Reading samples...")
-            for sample in tqdm(load_solutions(flags.samples)):
+        executor = None  # created on first submit, once the timings exist
+        futures = []
+        future_identifiers = {}  # future -> identifier indices of its batch
+        identifiers = []  # identifier index -> human-readable identifier
+        task_index = {task_id: i for i, task_id in enumerate(problems)}
+        completion_counts = np.zeros(len(problems), dtype=np.int64)
+        n_samples = 0
+        unknown_tasks = set()  # warned-about task_ids absent from the dataset
+        batches = defaultdict(list)  # task_id -> [(completion_id, solution, identifier)]
+        deferred = []  # batches filled before the groundtruth timing was ready
+
+        def submit_batch(task_id, batch):
+            nonlocal executor
+            if executor is None:
+                # Deferring pool creation to the first submit guarantees the
+                # timings are published before any worker is forked.
+                executor = _get_executor(n_workers, problems, expected_time)
+            future = executor.submit(
+                _check_batch,
+                flags.dataset,
+                task_id,
+                batch,
+                flags.min_time_limit,
+            )
+            future_identifiers[future] = [identifier for _, _, identifier in batch]
+            futures.append(future)
+
+        def flush_batch(task_id):
+            nonlocal expected_time
+            batch = batches.pop(task_id)
+            if expected_time is None:
+                if gt_future.done():
+                    expected_time = gt_future.result()
+                else:
+                    deferred.append((task_id, batch))
+                    return
+            submit_batch(task_id, batch)
+
+        print("Reading samples...")
+        try:
+            for sample in tqdm(_stream_samples(flags.samples)):
                 task_id = sample["task_id"]
-                
-                if task_id not in problems:
-                    warn(
-                        f"Task {task_id} is found in the samples but not found in the dataset"
-                    )
+
+                if task_id not in task_index:
+                    if task_id not in unknown_tasks:
+                        unknown_tasks.add(task_id)
+                        warn(
+                            f"Task {task_id} is found in the samples but not found in the dataset"
+                        )
                     continue
                 solution = (
                     sample["solution"]
@@ -152,43 +491,72 @@ def evaluate(flags):
                 )
                 if flags.reprompt:
                     solution = problems[task_id]["prompt_wo_doc"] + "\n    pass\n" + solution
-                remainings.add(sample["_identifier"])
-                args = (
-                    flags.dataset,
-                    completion_id[task_id],
-                    problems[task_id],
-                    solution,
-                    sample["_identifier"],
-                    flags.min_time_limit,
-                    expected_time[task_id],
+                index = task_index[task_id]
+                # Ship a small int to the workers instead of the long
+                # "<task_id> (line ...)" string; it is only resolved back for
+                # diagnostics in the parent.
+                identifier = len(identifiers)
+                identifiers.append(sample["_identifier"])
+                batches[task_id].append(
+                    (int(completion_counts[index]), solution, identifier)
                 )
-                futures.append(executor.submit(check_correctness, *args))
-                completion_id[task_id] += 1
+                if len(batches[task_id]) >= _BATCH_SIZE:
+                    flush_batch(task_id)
+                completion_counts[index] += 1
                 n_samples += 1
 
-            assert n_samples == len(remainings), "Missing problems in unfinished"
-            assert len(completion_id) == len(problems), "Missing problems in samples"
-
-            def stucking_checker():
-                while remainings:
-                    last_size = len(remainings)
-                    time.sleep(120)
-                    if last_size != len(remainings) or len(remainings) == 0:
+            if expected_time is None:
+                expected_time = gt_future.result()
+        except BaseException:
+            # Cancel still-pending groundtruth work so errors here surface
+            # promptly instead of waiting out the whole pass at shutdown.
+            gt_abort.set()
+            raise
+        for task_id, batch in deferred:
+            submit_batch(task_id, batch)
+        for task_id in list(batches):
+            flush_batch(task_id)
+
+        assert bool((completion_counts > 0).all()), "Missing problems in samples"
+
+        # Results slot straight into place by completion_id, which makes the
+        # per-task sort at the end unnecessary.
+        eval_results = [[None] * int(count) for count in completion_counts]
+
+        pending = set(futures)
+        try:
+            with tqdm(total=n_samples) as pbar:
+                while pending:
+                    done, pending = wait(
+                        pending, timeout=120, return_when=FIRST_COMPLETED
+                    )
+                    if not done:
+                        # Potential stucking
+                        remainings = [
+                            identifiers[identifier]
+                            for future in pending
+                            for identifier in future_identifiers[future]
+                        ]
+                        warn("No samples had finished testing in the last 120s")
+                        warn(f"{len(remainings)} samples to be tested: {remainings}")
                         continue
-                    # Potential stucking
-                    warn("No samples had finished testing in the last 120s")
-                    warn(f"{len(remainings)} samples to be tested: {remainings}")
-
-            threading.Thread(target=stucking_checker).start()
-
-            for future in tqdm(as_completed(futures), total=n_samples):
-                result = future.result()
-                remainings.remove(result["_identifier"])
-                eval_results[result["task_id"]].append(result)
-
-        # sort the results for each problem by completion_id
-        for task_id, task_results in eval_results.items():
-            task_results.sort(key=lambda x: x["completion_id"])
+                    for future in done:
+                        for result in future.result():
+                            task_results = eval_results[task_index[result["task_id"]]]
+                            task_results[result["completion_id"]] = result
+                            pbar.update(1)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); the pool is unusable, so drop
+            # the cached one and fail loudly instead of hanging on the rest.
+            _discard_executor()
+            raise RuntimeError(
+                "A worker process died unexpectedly and broke the pool; "
+                "discarded it. Re-run the evaluation to retry."
+            )
+
+        # the results for each problem are already ordered by completion_id
+        for task_id, index in task_index.items():
+            task_results = eval_results[index]
             results["eval"][task_id] = []
             for res in task_results:
                 stat, details = res["base"]
@@ -202,25 +570,34 @@ def evaluate(flags):
                 )
 
     # Calculate pass@k.
-    total = np.array([len(r) for r in results["eval"].values()])
-    base_correct = []
-
-    for res in results["eval"].values():
-        bc = sum([r["status"] == PASS for r in res])
-        base_correct.append(bc)
-
-    base_correct = np.array(base_correct)
+    if total is None:
+        n_tasks = len(results["eval"])
+        total = np.fromiter(
+            (len(r) for r in results["eval"].values()), dtype=np.int64, count=n_tasks
+        )
+        base_correct = np.fromiter(
+            (
+                sum(r["status"] == PASS for r in res)
+                for res in results["eval"].values()
+            ),
+            dtype=np.int64,
+            count=n_tasks,
+        )
 
+    min_total = int(total.min())
+    ks = [k for k in [1, 5, 10, 25, 100] if min_total >= k]
     pass_at_k = {
-        f"pass@{k}": estimate_pass_at_k(total, base_correct, k).mean()
-        for k in [1, 5, 10, 25, 100]
-        if total.min() >= k
+        f"pass@{k}": estimate.mean()
+        for k, estimate in estimate_pass_at_ks(total, base_correct, ks).items()
     }
     cprint(f"{flags.dataset}", "green")
     for k, v in pass_at_k.items():
         cprint(f"{k}:\t{v:.3f}", "green")
 
-    # save results
+    # save results; nothing new to write when resumed from the counts sidecar
+    if results is None:
+        return
+
     if os.path.isfile(result_path):
         decision = ""
         while decision.lower() not in ["y", "n"]:
@@ -236,8 +613,8 @@ def evaluate(flags):
             print(f"Backup {result_path} to {new_path}")
 
     if not os.path.isfile(result_path):
-        with open(result_path, "w") as f:
-            json.dump(results, f)
+        _write_results(result_path, results)
+        np.savez_compressed(counts_path, total=total, base_correct=base_correct)
 
 
 def main():